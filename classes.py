@@ -1,5 +1,6 @@
-from typing import List, Tuple
+from typing import List, Sequence, Tuple
 from dataclasses import dataclass
+from layouts import DEFAULT_LAYOUT
 
 @dataclass
 class NormalSong:
@@ -12,4 +13,27 @@ class PreciseSong:
     tempo: int
     transpose: int
     song_clock: int
-    note_list: List[Tuple[str, int]]
\ No newline at end of file
+    # Entries are (MIDI note, timestamp); the layout's action table turns notes into keys
+    note_list: List[Tuple[int, int]]
+    layout: str = DEFAULT_LAYOUT
+
+@dataclass
+class CompiledSong(PreciseSong):
+    # note_list is a read-only view over a memory-mapped .vps file (see songfile.py)
+    note_list: Sequence[Tuple[int, int]]
+    path: str = ""
+
+    def close(self):
+        self.note_list.close()
+
+@dataclass
+class TrackInfo:
+    track: int
+    channel: int
+    name: str
+    note_count: int
+    low_note: int
+    high_note: int
+    start: int
+    end: int
+    density: float
\ No newline at end of file
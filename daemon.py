@@ -0,0 +1,353 @@
+import os
+import sys
+import json
+import queue
+import time
+import signal
+import argparse
+import collections
+import tempfile
+import threading
+import socketserver
+from player import Player
+from midi import Midi
+from classes import PreciseSong, CompiledSong
+import songfile
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'virtual-piano.sock')
+
+
+class SongLibrary:
+
+    SONG_EXTENSIONS = ('.sheet', '.mid', '.midi', songfile.EXTENSION)
+    CACHE_SIZE = 8
+
+    def __init__(self, songs_dir: str, player: Player):
+        self.songs_dir = songs_dir
+        self.player = player
+        # Least recently loaded first; cached songs are shared, so they are never modified
+        self.cache = collections.OrderedDict()
+        # Held across lookup, translation and eviction; re-entrant so callers can extend it
+        self.lock = threading.RLock()
+
+    def list(self):
+        if not os.path.exists(self.songs_dir):
+            return []
+        return sorted(song_file for song_file in os.listdir(self.songs_dir) if song_file.endswith(self.SONG_EXTENSIONS))
+
+    def resolve(self, song_file: str) -> str:
+        if os.path.basename(song_file) != song_file or not song_file.endswith(self.SONG_EXTENSIONS):
+            raise ValueError(f"Invalid song: {song_file}")
+        file_path = os.path.join(self.songs_dir, song_file)
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"Song not found: {song_file}")
+        return file_path
+
+    def load(self, song_file: str, skip_drums: bool = False, layout: str = None):
+        with self.lock:
+            file_path = self.resolve(song_file)
+            key = (song_file, os.path.getmtime(file_path), skip_drums, layout)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+            if song_file.endswith('.sheet'):
+                song = self.player.translator(file_path)
+                if song is None:
+                    raise ValueError(f"Could not translate {song_file}")
+            elif song_file.endswith('.mid') or song_file.endswith('.midi'):
+                options = {'skip_drums': skip_drums}
+                if layout:
+                    options['layout'] = layout
+                song = Midi(file_path).translate(**options)
+            else:
+                song = songfile.load(file_path)
+            self.cache[key] = song
+            while len(self.cache) > self.CACHE_SIZE:
+                _, evicted = self.cache.popitem(last=False)
+                # The song being played is closed by the daemon once it is replaced
+                if isinstance(evicted, CompiledSong) and evicted is not self.player.current_song:
+                    evicted.close()
+            return song
+
+    def is_cached(self, song) -> bool:
+        with self.lock:
+            return any(cached is song for cached in self.cache.values())
+
+
+class PlayerDaemon:
+
+    # Progress fires once per note; subscribers get at most one status per interval
+    STATUS_INTERVAL = 0.05
+    # Commands after which every subscriber is sent the new status
+    STATE_COMMANDS = ('play', 'pause', 'resume', 'stop', 'seek', 'tempo', 'layout')
+
+    def __init__(self, songs_dir: str):
+        self.player = Player(error_callback=self.on_error, progress_callback=self.on_progress)
+        self.library = SongLibrary(songs_dir, self.player)
+        self.command_lock = threading.Lock()
+        self.subscribers = set()
+        self.song_name = None
+        self.loading = None
+        self.progress = 0
+        self.last_error = None
+        self.last_status = 0
+
+    def on_error(self, message: str):
+        self.last_error = message
+        self.broadcast({'event': 'error', 'error': message})
+
+    def on_progress(self, progress: float):
+        self.progress = progress
+        now = time.time()
+        if now - self.last_status >= self.STATUS_INTERVAL:
+            self.last_status = now
+            self.broadcast(self.status())
+
+    def broadcast(self, message: dict):
+        # Never blocks: a subscriber whose queue is full is dropped from the stream
+        for connection in list(self.subscribers):
+            if not connection.send(message, block=False):
+                self.subscribers.discard(connection)
+
+    def status(self) -> dict:
+        player = self.player
+        song = player.current_song
+        if self.loading:
+            state = 'loading'
+        elif player.is_playing:
+            state = 'paused' if player.is_paused else 'playing'
+        else:
+            state = 'stopped'
+        return {
+            'event': 'status',
+            'state': state,
+            'song': self.song_name,
+            'loading': self.loading,
+            'position': round(player.position() * 1000) if isinstance(song, PreciseSong) else None,
+            'progress': self.progress,
+            'rate': player.rate,
+            'tempo': round(song.tempo * player.rate) if song else None,
+            'layout': player.layout.name if player.layout else getattr(song, 'layout', None),
+            'error': self.last_error,
+        }
+
+    def handle(self, request: dict, connection) -> dict:
+        command = getattr(self, f"cmd_{request.get('cmd')}", None)
+        if command is None:
+            response = {'ok': False, 'error': f"Unknown command: {request.get('cmd')}"}
+        else:
+            try:
+                with self.command_lock:
+                    response = command(request, connection) or {}
+                response = {'ok': True, **response}
+            except Exception as e:
+                # str() of a KeyError is the repr of its argument, quotes included
+                message = e.args[0] if isinstance(e, KeyError) and e.args else str(e)
+                response = {'ok': False, 'error': str(message)}
+            else:
+                if request.get('cmd') in self.STATE_COMMANDS:
+                    self.broadcast(self.status())
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def _load(self, song_file: str, skip_drums: bool, layout: str, play: bool):
+        # The library lock is held until the song reaches the player, so a concurrent
+        # load cannot evict and close it in between
+        with self.library.lock:
+            try:
+                song = self.library.load(song_file, skip_drums, layout)
+            except Exception as e:
+                with self.command_lock:
+                    if self.loading == song_file:
+                        self.loading = None
+                self.on_error(f"Error in load: {e}")
+                return
+            with self.command_lock:
+                if self.loading != song_file:
+                    return
+                self.loading = None
+                self.last_error = None
+                self.song_name = song_file
+                self.progress = 0
+                previous = self.player.current_song
+                self.player.load(song)
+                if isinstance(previous, CompiledSong) and previous is not song and not self.library.is_cached(previous):
+                    previous.close()
+                if play:
+                    self.player.play()
+        self.broadcast(self.status())
+
+    def cmd_list(self, request, connection):
+        return {'songs': self.library.list()}
+
+    def cmd_load(self, request, connection):
+        song_file = request.get('song')
+        if not song_file:
+            raise ValueError("Missing 'song'")
+        self.library.resolve(song_file)
+        # Translation runs off the command thread; completion is reported on the status stream
+        self.loading = song_file
+        self.last_error = None
+        threading.Thread(
+            target=self._load,
+            args=(song_file, bool(request.get('skip_drums', False)), request.get('layout'), bool(request.get('play', False))),
+            daemon=True
+        ).start()
+        return self.status()
+
+    def cmd_play(self, request, connection):
+        if self.player.current_song is None:
+            raise ValueError("No song loaded")
+        if self.player.is_paused:
+            self.player.pause()
+        elif not self.player.is_playing:
+            self.player.play()
+        return self.status()
+
+    def cmd_pause(self, request, connection):
+        if self.player.is_playing and not self.player.is_paused:
+            self.player.pause()
+        return self.status()
+
+    def cmd_resume(self, request, connection):
+        if self.player.is_paused:
+            self.player.pause()
+        return self.status()
+
+    def cmd_stop(self, request, connection):
+        self.player.stop()
+        self.progress = 0
+        return self.status()
+
+    def cmd_seek(self, request, connection):
+        if not isinstance(self.player.current_song, PreciseSong):
+            raise ValueError("Seeking needs a MIDI or compiled song")
+        if 'position' not in request:
+            raise ValueError("Missing 'position'")
+        self.player.seek(int(request['position']))
+        return self.status()
+
+    def cmd_tempo(self, request, connection):
+        if 'rate' in request:
+            self.player.set_rate(float(request['rate']))
+        elif 'bpm' in request:
+            if self.player.current_song is None:
+                raise ValueError("No song loaded")
+            # Applied as a rate so the (shared, cached) song keeps its own tempo
+            self.player.set_rate(int(request['bpm']) / self.player.current_song.tempo)
+        else:
+            raise ValueError("Missing 'rate' or 'bpm'")
+        return self.status()
+
+    def cmd_layout(self, request, connection):
+        self.player.set_layout(request.get('name'))
+        return self.status()
+
+    def cmd_status(self, request, connection):
+        return self.status()
+
+    def cmd_subscribe(self, request, connection):
+        self.subscribers.add(connection)
+        return self.status()
+
+    def cmd_unsubscribe(self, request, connection):
+        self.subscribers.discard(connection)
+        return self.status()
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+
+    OUTBOX_SIZE = 256
+
+    def setup(self):
+        super().setup()
+        # Lines are written by a per-connection thread so callers never block on the socket
+        self.outbox = queue.Queue(self.OUTBOX_SIZE)
+        self.closed = False
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+    def _write(self):
+        while True:
+            line = self.outbox.get()
+            if line is None:
+                return
+            try:
+                self.wfile.write(line)
+            except OSError:
+                self.closed = True
+                return
+
+    def send(self, message: dict, block: bool = True) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.outbox.put((json.dumps(message) + '\n').encode('utf-8'), block=block)
+            return True
+        except queue.Full:
+            return False
+
+    def finish(self):
+        try:
+            self.outbox.put(None, timeout=1)
+        except queue.Full:
+            pass
+        self.writer.join(timeout=1)
+        super().finish()
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    self.send({'ok': False, 'error': "Invalid JSON"})
+                    continue
+                if not isinstance(request, dict):
+                    self.send({'ok': False, 'error': "Request must be an object"})
+                    continue
+                self.send(daemon.handle(request, self))
+        except OSError:
+            pass
+        finally:
+            daemon.subscribers.discard(self)
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: PlayerDaemon):
+        self.daemon = daemon
+        super().__init__(socket_path, DaemonHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the player headless behind a local JSON socket")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument('--songs', default='songs', help="Song library directory")
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    daemon = PlayerDaemon(args.songs)
+    server = DaemonServer(args.socket, daemon)
+    os.chmod(args.socket, 0o600)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.player.stop()
+        server.server_close()
+        os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
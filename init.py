@@ -6,11 +6,11 @@ from PyQt5.QtCore import Qt, QPoint, QTimer
 from PyQt5.QtGui import QPainter, QColor, QBrush, QPen, QFont
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem, QLabel, QFrame, QPushButton, QProgressBar, QLineEdit, QCheckBox
 from pynput import keyboard
-import mido
 
 from player import Player
 from midi import Midi
-from classes import NormalSong, PreciseSong
+from classes import NormalSong, PreciseSong, CompiledSong
+import songfile
 
 class CustomButton(QWidget):
      def __init__(self, color, outline, parent=None):
@@ -68,7 +68,7 @@ class CustomTitleBar(QWidget):
          self.window().close()
 
 class SongWidget(QFrame):
-     def __init__(self, file_name, tempo, transposition, full_file_name, parent=None):
+     def __init__(self, file_name, tempo, transposition, full_file_name, details="", tooltip="", parent=None):
         super().__init__(parent)
         self.setFrameShape(QFrame.StyledPanel)
         self.setStyleSheet("""
@@ -90,10 +90,12 @@ class SongWidget(QFrame):
         header.setFont(QFont("Arial", 10, QFont.Bold))
         header.setStyleSheet("background-color: #3e3e3e; border-radius: 5px; padding: 5px;")
         layout.addWidget(header)
-        footer = QLabel(f"BPM: {tempo} ∙ Transposition: {transposition}")
+        footer = QLabel(f"BPM: {tempo} ∙ Transposition: {transposition}" + (f" ∙ {details}" if details else ""))
         footer.setFont(QFont("Arial", 8))
         footer.setStyleSheet("background-color: #3e3e3e; border-radius: 5px; padding: 5px;")
         layout.addWidget(footer)
+        if tooltip:
+            self.setToolTip(tooltip)
         self.setLayout(layout)
         self.setStyleSheet("""
             QFrame {
@@ -108,6 +110,9 @@ class SongWidget(QFrame):
         """)
 
 class MyApp(QWidget):
+    RATE_STEP = 0.25
+    NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
     def __init__(self):
         super().__init__()
         self.currentSheet = None
@@ -121,6 +126,7 @@ class MyApp(QWidget):
         self.target_progress = 0
         self.current_progress = 0
         self.newline_delay = True
+        self.skip_drums = False
         self.initUI()
         self.loadSongs()
         self.keyboard_listener = keyboard.Listener(on_press=self.on_key_press)
@@ -181,6 +187,15 @@ class MyApp(QWidget):
         """)
         self.newlineToggle.stateChanged.connect(self.toggleNewlineDelay)
         main_layout.addWidget(self.newlineToggle)
+        self.drumsToggle = QCheckBox("Skip Drums")
+        self.drumsToggle.setStyleSheet("""
+            QCheckBox {
+                color: white;
+                font-size: 12px;
+            }
+        """)
+        self.drumsToggle.stateChanged.connect(self.toggleSkipDrums)
+        main_layout.addWidget(self.drumsToggle)
         self.songList = QListWidget(self)
         self.songList.setStyleSheet("""
             QListWidget {
@@ -307,6 +322,8 @@ class MyApp(QWidget):
     def loadSongs(self):
         self.songList.clear()
         self.song_items = []
+        # Parsed and indexed once per refresh; track selection only filters the index
+        self.midi_files = {}
         songs_dir = 'songs'
         if not os.path.exists(songs_dir):
             item = QListWidgetItem("No 'songs' directory found.")
@@ -331,18 +348,34 @@ class MyApp(QWidget):
                             found_sheets = True
                 elif song_file.endswith('.mid') or song_file.endswith('.midi'):
                     file_path = os.path.join(songs_dir, song_file)
-                    midi = mido.MidiFile(file_path)
-                    tempo = int(mido.tempo2bpm(mido.bpm2tempo(120)))  # Default to 120 BPM if not specified
+                    midi = Midi(file_path)
+                    self.midi_files[song_file] = midi
+                    note_count = sum(info.note_count for info in midi.tracks.values())
+                    track_count = len({info.track for info in midi.tracks.values()})
+                    details = f"Tracks: {track_count} ∙ Notes: {note_count}"
+                    tooltip = "\n".join(self.describeTrack(info) for info in midi.tracks.values())
+                    song_name = os.path.splitext(song_file)[0]
+                    song_item = QListWidgetItem()
+                    song_widget = SongWidget(song_name, midi.tempo, "N/A", song_file, details, tooltip)
+                    song_item.setSizeHint(song_widget.sizeHint())
+                    self.songList.addItem(song_item)
+                    self.songList.setItemWidget(song_item, song_widget)
+                    self.song_items.append(song_item)
+                    found_sheets = True
+                elif song_file.endswith(songfile.EXTENSION):
+                    file_path = os.path.join(songs_dir, song_file)
+                    song = songfile.load(file_path)
                     song_name = os.path.splitext(song_file)[0]
                     song_item = QListWidgetItem()
-                    song_widget = SongWidget(song_name, tempo, "N/A", song_file)
+                    song_widget = SongWidget(song_name, song.tempo, song.transpose, song_file)
+                    song.close()
                     song_item.setSizeHint(song_widget.sizeHint())
                     self.songList.addItem(song_item)
                     self.songList.setItemWidget(song_item, song_widget)
                     self.song_items.append(song_item)
                     found_sheets = True
             if not found_sheets:
-                item = QListWidgetItem("No '.sheet' or '.midi' files found in 'songs' directory.")
+                item = QListWidgetItem("No '.sheet', '.midi' or '.vps' files found in 'songs' directory.")
                 self.songList.addItem(item)
     def searchSongs(self):
         search_text = self.searchBar.text().lower()
@@ -362,10 +395,10 @@ class MyApp(QWidget):
                 bpm = bpm_trans.split("∙")[0].split(":")[1].strip()
                 trans = bpm_trans.split("∙")[1].split(":")[1].strip()
                 self.currentSheetLabel.setText(file_name)
-                self.bpmLabel.setText(f"BPM: {bpm}")
                 self.transLabel.setText(f"Trans: {trans}")
                 self.currentSheet = widget.full_file_name
                 self.tempo = int(bpm)
+                self.updateBpmLabel()
                 self.load_sheet(widget.full_file_name)
                 self.resetPlaybackState()
                 self.player_instance.stop()  # Stop the current playback
@@ -376,8 +409,17 @@ class MyApp(QWidget):
                 self.transLabel.setText("Trans: 0")
         except Exception as e:
             print(f"Error in onSongSelected: {e}")
+    def releaseSheet(self):
+        # A compiled song holds an open mmap, so stop playing it before closing
+        if isinstance(self.sheet, CompiledSong):
+            self.player_instance.stop()
+            if self.player_instance.play_thread:
+                self.player_instance.play_thread.join()
+            self.sheet.close()
+            self.sheet = ""
     def load_sheet(self, file_name):
         try:
+            self.releaseSheet()
             songs_dir = 'songs'
             file_path = os.path.join(songs_dir, file_name)
             if file_name.endswith('.sheet'):
@@ -385,10 +427,16 @@ class MyApp(QWidget):
                 self.sheet = song_data
                 self.progressBar.setValue(0)
             elif file_name.endswith('.mid') or file_name.endswith('.midi'):
-                midi = Midi(file_path, progress_callback=self.updateProgress)
-                song_data = midi.translate()
+                midi = self.midi_files.get(file_name)
+                if midi is None:
+                    midi = Midi(file_path, progress_callback=self.updateProgress)
+                    self.midi_files[file_name] = midi
+                song_data = midi.translate(skip_drums=self.skip_drums)
                 self.sheet = song_data
                 self.progressBar.setValue(0)
+            elif file_name.endswith(songfile.EXTENSION):
+                self.sheet = songfile.load(file_path)
+                self.progressBar.setValue(0)
         except Exception as e:
             print(f"Error in load_sheet: {e}")
     def resetPlaybackState(self):
@@ -439,8 +487,26 @@ class MyApp(QWidget):
             self.onSongSelected(self.songList.currentItem())
         else:
             self.current_index = 0
+    def changeRate(self, step):
+        self.player_instance.set_rate(self.player_instance.rate + step)
+        self.updateBpmLabel()
+    def updateBpmLabel(self):
+        rate = self.player_instance.rate
+        if rate == 1.0:
+            self.bpmLabel.setText(f"BPM: {self.tempo}")
+        else:
+            self.bpmLabel.setText(f"BPM: {round(self.tempo * rate)} ({rate:g}x)")
     def toggleNewlineDelay(self):
         self.newline_delay = self.newlineToggle.isChecked()
+    def toggleSkipDrums(self):
+        self.skip_drums = self.drumsToggle.isChecked()
+        if self.currentSheet and not self.start_playback:
+            self.load_sheet(self.currentSheet)
+    def describeTrack(self, info):
+        name = f" {info.name}" if info.name else ""
+        low = self.NOTE_NAMES[info.low_note % 12] + str(info.low_note // 12 - 1)
+        high = self.NOTE_NAMES[info.high_note % 12] + str(info.high_note // 12 - 1)
+        return f"Track {info.track}{name} ∙ Ch {info.channel + 1} ∙ {info.note_count} notes ∙ {low}–{high} ∙ {info.density:.1f}/s"
     def play_sheet(self):
          try:
              while not self.start_playback:
@@ -464,6 +530,10 @@ class MyApp(QWidget):
                 self.onPlayPauseButton()
             elif key == keyboard.Key.f3:
                 self.onSkipButton()
+            elif key == keyboard.Key.f4:
+                self.changeRate(-self.RATE_STEP)
+            elif key == keyboard.Key.f5:
+                self.changeRate(self.RATE_STEP)
         except AttributeError:
             pass
 
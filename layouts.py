@@ -0,0 +1,102 @@
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# A key action is the unshifted key to press and whether Shift must be held
+Action = Tuple[str, bool]
+
+SHIFT_BASES = {
+    '!': '1', '@': '2', '£': '3', '$': '4',
+    '%': '5', '^': '6', '&': '7', '*': '8',
+    '(': '9', ')': '0'
+}
+
+SHIFT_CHARS = [
+    "#", "_", "+", "{", "}", "|", ":", "\\", "\"", "<", ">", "?"
+]
+
+VIRTUAL_PIANO = {
+    36: '1',  37: '!',  38: '2',  39: '@',  40: '3',  41: '4',  42: '$',
+    43: '5',  44: '%',  45: '6',  46: '^',  47: '7',  48: '8',  49: '*',
+    50: '9',  51: '(',  52: '0',  53: 'q',  54: 'Q',  55: 'w',  56: 'W',
+    57: 'e',  58: 'E',  59: 'r',  60: 't',  61: 'T',  62: 'y',  63: 'Y',
+    64: 'u',  65: 'i',  66: 'I',  67: 'o',  68: 'O',  69: 'p',  70: 'P',
+    71: 'a',  72: 's',  73: 'S',  74: 'd',  75: 'D',  76: 'f',  77: 'g',
+    78: 'G',  79: 'h',  80: 'H',  81: 'j',  82: 'J',  83: 'k',  84: 'l',
+    85: 'L',  86: 'z',  87: 'Z',  88: 'x',  89: 'c',  90: 'C',  91: 'v',
+    92: 'V',  93: 'b',  94: 'B',  95: 'n',  96: 'm'
+}
+
+DEFAULT_LAYOUT = 'virtualpiano'
+
+
+def char_action(key: str) -> Action:
+    if key in SHIFT_BASES:
+        return (SHIFT_BASES[key], True)
+    if 'A' <= key <= 'Z':
+        return (key.lower(), True)
+    if key in SHIFT_CHARS:
+        return (key, True)
+    return (key, False)
+
+
+# Sheet songs store indices into CHAR_ACTIONS instead of characters
+CHAR_ACTIONS: List[Action] = []
+CHAR_INDEX: Dict[str, int] = {}
+# Sheets can be translated on several threads at once, each adding unseen characters
+CHAR_LOCK = threading.Lock()
+
+
+def char_index(key: str) -> int:
+    index = CHAR_INDEX.get(key)
+    if index is None:
+        with CHAR_LOCK:
+            index = CHAR_INDEX.get(key)
+            if index is None:
+                index = len(CHAR_ACTIONS)
+                CHAR_ACTIONS.append(char_action(key))
+                CHAR_INDEX[key] = index
+    return index
+
+
+for code in range(32, 127):
+    char_index(chr(code))
+char_index('£')
+
+
+@dataclass
+class KeyLayout:
+    name: str
+    note_map: Dict[int, str]
+    # Indexed by MIDI note number; None where the layout has no key for the note
+    actions: List[Optional[Action]]
+
+
+def compile_layout(name: str, note_map: Dict[int, str]) -> KeyLayout:
+    actions = [None] * 128
+    for note, key in note_map.items():
+        actions[note] = char_action(key)
+    return KeyLayout(name=name, note_map=note_map, actions=actions)
+
+
+LAYOUTS: Dict[str, KeyLayout] = {}
+
+
+def register_layout(name: str, note_map: Dict[int, str]) -> KeyLayout:
+    LAYOUTS[name] = compile_layout(name, note_map)
+    return LAYOUTS[name]
+
+
+def get_layout(name: str) -> KeyLayout:
+    if name not in LAYOUTS:
+        raise KeyError(f"Unknown layout: {name}")
+    return LAYOUTS[name]
+
+
+register_layout('virtualpiano', VIRTUAL_PIANO)
+# Same keys without the shifted black keys, for pianos that ignore Shift:
+# each black key falls back to the white key below it
+register_layout('virtualpiano-white', {
+    note: VIRTUAL_PIANO[note - 1] if char_action(key)[1] else key
+    for note, key in VIRTUAL_PIANO.items()
+})
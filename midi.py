@@ -2,87 +2,138 @@ import os
 import mido
 import heapq
 from classes import *
+from layouts import DEFAULT_LAYOUT, get_layout
 
 class Midi:
     
-    NOTE_MAP = {
-        36: '1',  38: '2',  40: '3',  41: '4',  43: '5',  45: '6',  47: '7',
-        48: '8',  50: '9',  52: '0',  53: 'q',  55: 'w',  57: 'e',  59: 'r',
-        60: 't',  62: 'y',  64: 'u',  65: 'i',  67: 'o',  69: 'p',  71: 'a',
-        72: 's',  74: 'd',  76: 'f',  77: 'g',  79: 'h',  81: 'j',  83: 'k',
-        84: 'l',  86: 'z',  88: 'x',  89: 'c',  91: 'v',  93: 'b',  95: 'n',
-        96: 'm'
-    }
+    DEFAULT_TEMPO = 500000
+    DRUM_CHANNEL = 9
 
-    SPECIAL_NOTE_MAP = {
-        37: '!',  39: '@',  42: '$',  44: '%',  46: '^',
-        49: '*',  51: '(',  54: 'Q',  56: 'W',  58: 'E',
-        61: 'T',  63: 'Y',  66: 'I',  68: 'O',  70: 'P',
-        73: 'S',  75: 'D',  78: 'G',  80: 'H',  82: 'J',
-        85: 'L',  87: 'Z',  90: 'C',  92: 'V',  94: 'B'
-    }
-    
     def __init__(self, filepath: str, progress_callback=None):
         if os.path.exists(filepath):
-            self.midi_file = mido.MidiFile(filepath)
+            midi_file = mido.MidiFile(filepath)
         else: 
             raise FileNotFoundError("File not found")
         self.progress_callback = progress_callback
-    
-    def translate(self):
-        note_list = []
-        tempo = 500000
-        ticks_per_beat = self.midi_file.ticks_per_beat
-        
-        song_clock = round(self.midi_file.length * 1000)
-        
-        absolute_time = 0
-        total_messages = sum(len(track) for track in self.midi_file.tracks)
+        # Only the index is kept; the parsed file is dropped once it is built
+        self.build_index(midi_file)
+
+    def build_index(self, midi_file: mido.MidiFile):
+        # One pass over every message: collect the tempo map and all note-ons tagged
+        # with their track and channel, then place them on a shared millisecond clock
+        tempo_changes = []
+        track_notes = []
+        self.track_names = {}
+        total_messages = sum(len(track) for track in midi_file.tracks)
         processed_messages = 0
-        for track in self.midi_file.tracks:
+        tick_offset = 0
+        end_tick = 0
+        for track_index, track in enumerate(midi_file.tracks):
+            notes = []
+            ticks = tick_offset
             for msg in track:
-                if msg.is_meta and msg.type == 'set_tempo':
-                    tempo = msg.tempo
-                    bpm = round(mido.tempo2bpm(tempo))
-                
-                absolute_time += mido.tick2second(msg.time, ticks_per_beat, tempo) * 1000
-                
-                if not msg.is_meta and msg.type == 'note_on' and msg.velocity > 0:
-                    note = msg.note
-                    if note in self.NOTE_MAP:
-                        clock_turn = round(absolute_time)
-                        note_list.append((self.NOTE_MAP[note], clock_turn))
-                    elif note in self.SPECIAL_NOTE_MAP:
-                        clock_turn = round(absolute_time)
-                        note_list.append((self.SPECIAL_NOTE_MAP[note], clock_turn))
+                ticks += msg.time
+                if msg.is_meta:
+                    if msg.type == 'set_tempo':
+                        tempo_changes.append((ticks, msg.tempo))
+                    elif msg.type == 'track_name':
+                        self.track_names[track_index] = msg.name
+                elif msg.type == 'note_on' and msg.velocity > 0:
+                    notes.append((ticks, msg.note, track_index, msg.channel))
                 processed_messages += 1
                 if self.progress_callback:
                     progress = (processed_messages / total_messages) * 100
                     self.progress_callback(progress)
-        return PreciseSong(tempo=bpm, transpose=1, song_clock=song_clock, note_list=note_list)
-    
+            track_notes.append(notes)
+            end_tick = max(end_tick, ticks)
+            # Type 2 files hold independent patterns that play one after another
+            if midi_file.type == 2:
+                tick_offset = ticks
+        tempo_changes.sort(key=lambda change: change[0])
+
+        ticks_per_beat = midi_file.ticks_per_beat
+        # Display the opening tempo; later changes are applied through the clock
+        opening_tempo = tempo_changes[0][1] if tempo_changes and tempo_changes[0][0] == 0 else self.DEFAULT_TEMPO
+        self.tempo = round(mido.tempo2bpm(opening_tempo))
+        tempo = self.DEFAULT_TEMPO
+        tempo_index = 0
+        segment_tick = 0
+        segment_time = 0.0
+
+        def clock_at(ticks):
+            # Ticks must arrive in order; the tempo map is walked forward only once
+            nonlocal tempo, tempo_index, segment_tick, segment_time
+            while tempo_index < len(tempo_changes) and tempo_changes[tempo_index][0] <= ticks:
+                change_tick, change_tempo = tempo_changes[tempo_index]
+                segment_time += mido.tick2second(change_tick - segment_tick, ticks_per_beat, tempo) * 1000
+                segment_tick = change_tick
+                tempo = change_tempo
+                tempo_index += 1
+            return round(segment_time + mido.tick2second(ticks - segment_tick, ticks_per_beat, tempo) * 1000)
+
+        self.notes = [
+            (clock_at(ticks), note, track_index, channel)
+            for ticks, note, track_index, channel in heapq.merge(*track_notes)
+        ]
+        self.song_clock = clock_at(end_tick)
+        self.index_tracks()
+
+    def index_tracks(self):
+        groups = {}
+        for clock_turn, note, track_index, channel in self.notes:
+            group = groups.get((track_index, channel))
+            if group is None:
+                groups[(track_index, channel)] = [1, note, note, clock_turn, clock_turn]
+            else:
+                group[0] += 1
+                group[1] = min(group[1], note)
+                group[2] = max(group[2], note)
+                group[4] = clock_turn
+
+        self.tracks = {}
+        for (track_index, channel), (count, low, high, start, end) in sorted(groups.items()):
+            duration = (end - start) / 1000.0
+            self.tracks[(track_index, channel)] = TrackInfo(
+                track=track_index, channel=channel, name=self.track_names.get(track_index, ""),
+                note_count=count, low_note=low, high_note=high, start=start, end=end,
+                density=count / duration if duration > 0 else float(count)
+            )
+
+    def select(self, tracks=None, channels=None, skip_drums: bool = False):
+        selection = set()
+        for track_index, channel in self.tracks:
+            if tracks is not None and track_index not in tracks:
+                continue
+            if channels is not None and channel not in channels:
+                continue
+            if skip_drums and channel == self.DRUM_CHANNEL:
+                continue
+            selection.add((track_index, channel))
+        return selection
+
+    def translate(self, tracks=None, channels=None, skip_drums: bool = False, layout: str = DEFAULT_LAYOUT):
+        selection = self.select(tracks, channels, skip_drums)
+        actions = get_layout(layout).actions
+
+        note_list = []
+        for clock_turn, note, track_index, channel in self.notes:
+            if (track_index, channel) in selection and actions[note] is not None:
+                note_list.append((note, clock_turn))
+        return PreciseSong(tempo=self.tempo, transpose=1, song_clock=self.song_clock, note_list=note_list, layout=layout)
+
     def merge(self, channel: int = 0):
-        # Experimental feature (NO WORKIE)
-        merged_track = mido.MidiTrack()
-        for track in self.midi_file.tracks:
-            for msg in track:
-                if msg.type in ('note_on', 'note_off'):
-                    msg.channel = channel
-                merged_track.append(msg)
-        
-        new_midi = mido.MidiFile()
-        new_midi.tracks.append(merged_track)
-        
-        self.midi_file = new_midi
-        
+        # Folds every track onto one channel in the index; the parsed file is left untouched
+        self.notes = [(clock_turn, note, 0, channel) for clock_turn, note, _, _ in self.notes]
+        self.track_names = {0: "Merged"}
+        self.index_tracks()
         return self
     
 if __name__ == "__main__":
-    import time 
+    import time
+    import songfile
     start = time.time()
-    midi = midi_file("song.mid")
+    midi = Midi("song.mid")
     song = midi.translate()
     print("Song Processing Took:", time.time() - start)
-    
-    with open ("song.txt", "w") as f:
-        f.write(str(song))
+
+    songfile.compile_song(song, "song" + songfile.EXTENSION)
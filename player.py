@@ -2,22 +2,12 @@ import re
 import time
 import threading
 from classes import NormalSong, PreciseSong
+from layouts import CHAR_ACTIONS, char_index, get_layout
 from pynput import keyboard
 from typing import Callable, Union
 
 class Player:
 
-    TRANSFORM_CASES = {
-        '!': '1', '@': '2', '£': '3', '$': '4',
-        '%': '5', '^': '6', '&': '7', '*': '8',
-        '(': '9', ')': '0'
-    }
-
-    SPECIAL_CHARS = [
-        "!", "@", "#", "$", "%", "^", "&", "*", "(", ")",
-        "_", "+", "{", "}", "|", ":", "\\","\"","<",">","?"
-    ]
-
     WAIT_CASES = {
         "|": (1, 'm'), "-": (2, 'm'),
         "--": (4, 'm'), "----": (8, 'm'),
@@ -25,6 +15,9 @@ class Player:
         "<": (8, 'd'), ">": (16, 'd')
     }
 
+    MIN_RATE = 0.25
+    MAX_RATE = 4.0
+
     def __init__(self, error_callback: Callable, progress_callback: Callable):
         self.controller = keyboard.Controller()
         self.error_callback = error_callback
@@ -33,33 +26,39 @@ class Player:
         self.is_paused = False
         self.play_thread = None
         self.current_song = None
-        self.pause_time = 0
-        self.start_time = 0
-
-    def isShifted(self, key: str):
-        ascii_value = ord(key)
-        if 65 <= ascii_value <= 90:
-            return True
-        if key in self.SPECIAL_CHARS:
-            return True
-        return False
-
-    def pressKey(self, key: str):
+        self.rate = 1.0
+        # Song position is anchor_position (seconds of song time) plus the wall
+        # time since anchor_time scaled by rate; rate, pause and seek re-anchor it
+        self.anchor_position = 0.0
+        self.anchor_time = 0.0
+        self.clock_lock = threading.Lock()
+        self.timing_changed = threading.Event()
+        self.seek_pending = False
+        # Overrides the layout a precise song was translated with; None follows the song
+        self.layout = None
+
+    def pressAction(self, key: str, shift: bool):
         try:
-            if key in self.TRANSFORM_CASES:
-                key = self.TRANSFORM_CASES[key]
-            if self.isShifted(key):
+            if shift:
                 self.controller.press(keyboard.Key.shift)
-                self.controller.press(key.lower())
+                self.controller.press(key)
                 time.sleep(0.001)
-                self.controller.release(key.lower())
+                self.controller.release(key)
                 self.controller.release(keyboard.Key.shift)
             else:
                 self.controller.press(key)
                 time.sleep(0.001)
                 self.controller.release(key)
         except Exception as e:
-            self.error_callback(f"Error in pressKey: {e}")
+            self.error_callback(f"Error in pressAction: {e}")
+
+    def pressNote(self, note: int, actions):
+        action = actions[note]
+        if action is not None:
+            self.pressAction(*action)
+
+    def set_layout(self, name: str = None):
+        self.layout = get_layout(name) if name else None
 
     def load(self, song_data: Union[NormalSong, PreciseSong]):
         self.current_song = song_data
@@ -77,49 +76,68 @@ class Player:
 
         self.is_playing = True
         self.is_paused = False
-        self.start_time = time.time() - self.pause_time
+        with self.clock_lock:
+            self.anchor_time = time.time()
+        self.seek_pending = True
         self.play_thread = threading.Thread(target=self._play)
         self.play_thread.start()
 
     def _play(self):
         try:
             if isinstance(self.current_song, NormalSong):
-                beat_delay = 30.0 / self.current_song.tempo
                 total_notes = len(self.current_song.note_list)
                 for index, note in enumerate(self.current_song.note_list):
                     while self.is_paused:
-                        time.sleep(0.1)
+                        self.timing_changed.clear()
+                        self.timing_changed.wait(0.1)
                     if not self.is_playing:
                         break
+                    beat_delay = 30.0 / self.current_song.tempo
                     if isinstance(note, tuple):  # Check if the note is a tuple (polyphonic)
                         for n in note:
-                            self.pressKey(n)
-                        time.sleep(beat_delay)
+                            self.pressNote(n, CHAR_ACTIONS)
+                        self.wait_song_time(beat_delay)
                     elif note in self.WAIT_CASES:
                         delay, unit = self.WAIT_CASES[note]
-                        time.sleep(beat_delay * delay)
+                        self.wait_song_time(beat_delay * delay)
                     else:
-                        self.pressKey(note)
-                        time.sleep(beat_delay)
+                        self.pressNote(note, CHAR_ACTIONS)
+                        self.wait_song_time(beat_delay)
 
                     progress = (index + 1) / total_notes * 100
                     self.progress_callback(progress)
             elif isinstance(self.current_song, PreciseSong):
-                total_time = self.current_song.note_list[-1][1] / 1000.0
-                for note, timestamp in self.current_song.note_list:
-                    while self.is_paused:
-                        time.sleep(0.1)
-                    if not self.is_playing:
+                note_list = self.current_song.note_list
+                song_layout = get_layout(self.current_song.layout)
+                total_notes = len(note_list)
+                total_time = note_list[-1][1] / 1000.0
+                index = 0
+                while self.is_playing:
+                    self.timing_changed.clear()
+                    if self.seek_pending:
+                        self.seek_pending = False
+                        index = self.note_index(self.anchor_position * 1000)
+                    if index >= total_notes:
+                        # Finished on its own, so the next play() starts from the top
+                        with self.clock_lock:
+                            self.anchor_position = 0.0
                         break
-                    current_time = time.time() - self.start_time
-                    wait_time = (timestamp / 1000.0) - current_time
+                    if self.is_paused:
+                        self.timing_changed.wait(0.1)
+                        continue
+                    note, timestamp = note_list[index]
+                    wait_time = ((timestamp / 1000.0) - self.position()) / self.rate
                     if wait_time > 0:
-                        time.sleep(wait_time)
+                        # Woken early by pause, seek or a rate change, so re-check the schedule
+                        self.timing_changed.wait(wait_time)
+                        continue
+                    actions = (self.layout or song_layout).actions
                     if isinstance(note, tuple):  # Check if the note is a tuple (polyphonic)
                         for n in note:
-                            self.pressKey(n)
+                            self.pressNote(n, actions)
                     else:
-                        self.pressKey(note)
+                        self.pressNote(note, actions)
+                    index += 1
 
                     progress = (timestamp / 1000.0) / total_time * 100
                     self.progress_callback(progress)
@@ -128,22 +146,76 @@ class Player:
         finally:
             self.is_playing = False
 
+    def wait_song_time(self, seconds: float):
+        # Waits out song time at the current rate; wakes on stop, pause and rate changes
+        while seconds > 0 and self.is_playing:
+            self.timing_changed.clear()
+            if self.is_paused:
+                self.timing_changed.wait(0.1)
+                continue
+            rate = self.rate
+            started = time.time()
+            self.timing_changed.wait(seconds / rate)
+            seconds -= (time.time() - started) * rate
+
     def stop(self):
         self.is_playing = False
         self.is_paused = False
-        self.pause_time = 0
+        with self.clock_lock:
+            self.anchor_position = 0.0
+        self.timing_changed.set()
 
     def pause(self):
-        if self.is_paused:
-            self.is_paused = False
-            self.start_time += time.time() - self.pause_time
-        else:
-            self.is_paused = True
-            self.pause_time = time.time()
+        with self.clock_lock:
+            now = time.time()
+            if self.is_paused:
+                self.is_paused = False
+                self.anchor_time = now
+            else:
+                if self.is_playing:
+                    self.anchor_position += (now - self.anchor_time) * self.rate
+                self.is_paused = True
+        self.timing_changed.set()
+
+    def position(self) -> float:
+        with self.clock_lock:
+            if self.is_paused or not self.is_playing:
+                return self.anchor_position
+            return self.anchor_position + (time.time() - self.anchor_time) * self.rate
+
+    def note_index(self, position_ms: float) -> int:
+        note_list = self.current_song.note_list
+        low, high = 0, len(note_list)
+        while low < high:
+            middle = (low + high) // 2
+            if note_list[middle][1] < position_ms:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def seek(self, position_ms: int):
+        with self.clock_lock:
+            self.anchor_position = max(position_ms, 0) / 1000.0
+            self.anchor_time = time.time()
+        self.seek_pending = True
+        self.timing_changed.set()
+
+    def set_rate(self, rate: float):
+        rate = min(max(rate, self.MIN_RATE), self.MAX_RATE)
+        with self.clock_lock:
+            now = time.time()
+            if self.is_playing and not self.is_paused:
+                self.anchor_position += (now - self.anchor_time) * self.rate
+            self.anchor_time = now
+            self.rate = rate
+        self.timing_changed.set()
 
     def set_tempo(self, tempo: int):
         if isinstance(self.current_song, NormalSong):
             self.current_song.tempo = tempo
+        elif isinstance(self.current_song, PreciseSong):
+            self.set_rate(tempo / self.current_song.tempo)
 
     def translator(self, song_file: str, newline_delay: bool = True, polynote_delay: bool = False):
         try:
@@ -165,9 +237,10 @@ class Player:
                                 replaced = '~'.join(match.split())
                             else:
                                 replaced = ''.join(match.split())
-                            note_list.append(tuple(replaced))
+                            note_list.append(tuple(char_index(key) for key in replaced))
                         elif note and not note.isspace():
-                            note_list.extend(note)
+                            # Wait markers stay as characters, keys become CHAR_ACTIONS indices
+                            note_list.extend(key if key in self.WAIT_CASES else char_index(key) for key in note)
 
                     return NormalSong(tempo=tempo, transpose=transpose, note_list=note_list)
             else:
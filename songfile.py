@@ -0,0 +1,170 @@
+import os
+import sys
+import mmap
+import stat
+import struct
+import tempfile
+from array import array
+from collections.abc import Sequence
+from classes import PreciseSong, CompiledSong
+
+# Layout of a compiled song (.vps), all little-endian:
+#   header      magic, version, flags, tempo, transpose, song_clock, note_count, key_count
+#   layout      length: u8, then the ascii name of the song's key layout
+#   key table   key_count entries of (kind: u8, length: u16, MIDI note bytes), see KEY_* below
+#   padding     up to a 4 byte boundary
+#   timestamps  note_count x u32, milliseconds
+#   key indices note_count x u16, into the key table
+
+MAGIC = b'VPSF'
+VERSION = 1
+EXTENSION = '.vps'
+
+HEADER = struct.Struct('<4sHHiiIII')
+KEY_ENTRY = struct.Struct('<BH')
+LAYOUT_ENTRY = struct.Struct('<B')
+
+# Compiled songs come from PreciseSong, whose keys are MIDI notes or chords of them
+KEY_NOTE = 0
+KEY_NOTE_CHORD = 1
+
+
+class NoteView(Sequence):
+
+    def __init__(self, keys: tuple, timestamps, key_indices, mm: mmap.mmap = None):
+        self.keys = keys
+        self.timestamps = timestamps
+        self.key_indices = key_indices
+        self._mm = mm
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return (self.keys[self.key_indices[index]], self.timestamps[index])
+
+    def __iter__(self):
+        keys = self.keys
+        for key_index, timestamp in zip(self.key_indices, self.timestamps):
+            yield (keys[key_index], timestamp)
+
+    def close(self):
+        if isinstance(self.timestamps, memoryview):
+            self.timestamps.release()
+            self.key_indices.release()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+def _encode_key(key) -> bytes:
+    if isinstance(key, int):
+        return KEY_ENTRY.pack(KEY_NOTE, 1) + bytes([key])
+    if isinstance(key, tuple) and all(isinstance(note, int) for note in key):
+        return KEY_ENTRY.pack(KEY_NOTE_CHORD, len(key)) + bytes(key)
+    raise ValueError(f"Cannot compile key {key!r}, expected MIDI notes")
+
+
+def _decode_key(kind: int, data: bytes):
+    if kind == KEY_NOTE:
+        return data[0]
+    if kind == KEY_NOTE_CHORD:
+        return tuple(data)
+    raise ValueError(f"Unknown key kind {kind}")
+
+
+def _align(offset: int) -> int:
+    return (offset + 3) & ~3
+
+
+def compile_song(song: PreciseSong, path: str):
+    keys = {}
+    timestamps = array('I')
+    key_indices = array('H')
+    for key, timestamp in song.note_list:
+        if key not in keys:
+            if len(keys) > 0xFFFF:
+                raise ValueError("Too many distinct keys to compile")
+            keys[key] = len(keys)
+        timestamps.append(timestamp)
+        key_indices.append(keys[key])
+    if sys.byteorder != 'little':
+        timestamps.byteswap()
+        key_indices.byteswap()
+
+    layout = song.layout.encode('ascii')
+    key_table = b''.join(_encode_key(key) for key in keys)
+    header = HEADER.pack(MAGIC, VERSION, 0, song.tempo, song.transpose, song.song_clock, len(timestamps), len(keys))
+    table_end = HEADER.size + LAYOUT_ENTRY.size + len(layout) + len(key_table)
+
+    # Written beside the target and swapped in, so open mappings keep the old file
+    fd, temp_path = tempfile.mkstemp(suffix=EXTENSION, dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(LAYOUT_ENTRY.pack(len(layout)) + layout)
+            f.write(key_table)
+            f.write(b'\x00' * (_align(table_end) - table_end))
+            f.write(timestamps.tobytes())
+            f.write(key_indices.tobytes())
+        os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load(path: str) -> CompiledSong:
+    if not os.path.exists(path):
+        raise FileNotFoundError("File not found")
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        if mm.size() < HEADER.size:
+            raise ValueError("Invalid compiled song")
+        magic, version, flags, tempo, transpose, song_clock, note_count, key_count = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError("Invalid compiled song")
+        if version != VERSION:
+            raise ValueError(f"Unsupported compiled song version {version}")
+
+        offset = HEADER.size
+        (length,) = LAYOUT_ENTRY.unpack_from(mm, offset)
+        offset += LAYOUT_ENTRY.size
+        layout = mm[offset:offset + length].decode('ascii')
+        offset += length
+
+        keys = []
+        for _ in range(key_count):
+            kind, length = KEY_ENTRY.unpack_from(mm, offset)
+            offset += KEY_ENTRY.size
+            keys.append(_decode_key(kind, mm[offset:offset + length]))
+            offset += length
+
+        timestamps_start = _align(offset)
+        indices_start = timestamps_start + note_count * 4
+        if mm.size() < indices_start + note_count * 2:
+            raise ValueError("Truncated compiled song")
+    except Exception:
+        mm.close()
+        raise
+
+    if sys.byteorder == 'little':
+        buffer = memoryview(mm)
+        timestamps = buffer[timestamps_start:indices_start].cast('I')
+        key_indices = buffer[indices_start:indices_start + note_count * 2].cast('H')
+        buffer.release()
+        note_list = NoteView(tuple(keys), timestamps, key_indices, mm)
+    else:
+        # Big-endian hosts cannot view the little-endian arrays in place
+        timestamps = array('I', mm[timestamps_start:indices_start])
+        key_indices = array('H', mm[indices_start:indices_start + note_count * 2])
+        timestamps.byteswap()
+        key_indices.byteswap()
+        mm.close()
+        note_list = NoteView(tuple(keys), timestamps, key_indices)
+
+    return CompiledSong(tempo=tempo, transpose=transpose, song_clock=song_clock, note_list=note_list, layout=layout, path=path)